@@ -1,18 +1,64 @@
-from dataclasses import asdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, fields
+from datetime import datetime
 from os import getcwd
 from pathlib import Path
+from tempfile import mkdtemp
+from threading import Thread
+from typing import Any
+from uuid import uuid4
 import argparse
+import glob
 import json
 import shutil
 import re
 from versioned_sphinx.config import Config
 from versioned_sphinx.git import Git, GitBranch, GitTag
-from versioned_sphinx.logger import ROOT_LOGGER as LOGGER
-from versioned_sphinx.sphinx import Sphinx
+from versioned_sphinx.logger import ROOT_LOGGER as LOGGER, add_stream_handler
+from versioned_sphinx.sphinx import STATIC_DIR, Sphinx, SphinxContext
 from versioned_sphinx.version import __version__ as version
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 __version__ = version
+MANIFEST_FILE = ".vs-manifest.json"
+"""The file in the build folder recording which commit each version was
+built from, so that unchanged versions can be skipped on the next build.
+"""
+_TRASH_SUFFIX = r"\.old\.[0-9a-f]{8}"
+"""What :func:`remove_in_background` adds to the name of a folder it's removing"""
+_FIELD_NAMES = {cls: tuple(f.name for f in fields(cls)) for cls in (GitBranch, GitTag)}
+
+
+def _field_names(bt: GitBranch | GitTag) -> tuple[str, ...]:
+    """Get the names of the fields of ``bt``, which may be any dataclass, like a
+    subclass of :class:`GitTag` returned by ``vs_sort``
+    """
+    names = _FIELD_NAMES.get(type(bt))
+    if names is None:
+        names = _FIELD_NAMES.setdefault(type(bt), tuple(f.name for f in fields(bt)))
+    return names
+
+
+@dataclass(frozen=True, slots=True)
+class VerifiedContext:
+    """The details gathered by :func:`verify_configuration`"""
+
+    sphinx: SphinxContext
+    """The sphinx project's details"""
+    inject_location: str
+    """The CSS selector of the element the version control is injected into,
+    either :attr:`~versioned_sphinx.config.Config.vs_inject_selector` or
+    the theme's pre-defined location
+    """
+    branches: list[GitBranch]
+    """The branches matching :attr:`~versioned_sphinx.config.Config.vs_pattern`"""
+    tags: list[GitTag]
+    """The tags matching :attr:`~versioned_sphinx.config.Config.vs_pattern`"""
 
 
 def execute(config: Config, git: Git, sphinx: Sphinx):
@@ -21,55 +67,34 @@ def execute(config: Config, git: Git, sphinx: Sphinx):
     generating the versioned docs.
     """
     LOGGER.info("versioned-sphinx v%s starting...", version)
-    verify_configuration(config, git, sphinx)
+    verified = verify_configuration(config, git, sphinx)
 
     build_path = config.build_path()
-    LOGGER.info("Cleaning build directory '%s'...", build_path)
-    if build_path.exists():
-        shutil.rmtree(build_path)
+    manifest = load_manifest(build_path)
+    # anything being replaced is moved aside and deleted in the background,
+    # which only needs to finish before returning
+    removals: list[Thread] = remove_leftovers(build_path)
+    if build_path.exists() and not manifest:
+        LOGGER.info("Cleaning build directory '%s'...", build_path)
+        removals.append(remove_in_background(build_path))
     build_path.mkdir(exist_ok=True)
 
-    LOGGER.info("Writing CSS and JS files...")
-    to_copy = ["choices.min.css", "choices.min.js", "versioned_sphinx.js"]
-    for f in to_copy:
-        p = Path(__file__).parent / "static" / f
-        shutil.copy(p, build_path / p.name)
-
-    # Handle control CSS
-    if config.vs_control_css:
-        if isinstance(config.vs_control_css, Path) or ".css" in config.vs_control_css:
-            p = Path(config.vs_control_css)
-            if not p.is_absolute():
-                p = (sphinx.get_conf_path().parent / p).resolve()
-
-            shutil.copy(p, build_path / "versioned_sphinx.css")
-        else:
-            with open(
-                build_path / "versioned_sphinx.css", "w", encoding="utf-8"
-            ) as file:
-                file.write(config.vs_control_css)
-    else:
-        shutil.copy(
-            # verify_configuration makes sure this path exists
-            sphinx.get_theme_css_file(sphinx.load_conf_file().html_theme),  # type: ignore
-            build_path / "versioned_sphinx.css",
-        )
-
-    branches = git.get_branches(config.vs_pattern, config.vs_git_ref_location)
-    LOGGER.info("Matched branches: %s", [b.name for b in branches])
+    bts = filter_branches_and_tags(config, [*verified.branches, *verified.tags])
+    display_names = {
+        id(bt): (config.vs_display_name(bt) if config.vs_display_name else bt.name)
+        for bt in bts
+    }
 
-    tags = git.get_tags(config.vs_pattern)
-    LOGGER.info("Matched tags: %s", [t.name for t in tags])
+    def display_name(bt: GitBranch | GitTag) -> str:
+        # vs_sort may return different objects than the ones it was given, so
+        # only those already seen (and still alive in bts) use the stored name
+        if id(bt) in display_names:
+            return display_names[id(bt)]
+        return config.vs_display_name(bt) if config.vs_display_name else bt.name
 
-    original_branch = git.get_current_branch()
     combined_with_name: list[tuple[str, GitBranch | GitTag]] = [
-        (
-            (config.vs_display_name(bt) if config.vs_display_name else bt.name),
-            bt,
-        )
-        for bt in sort_branches_and_tags(
-            config, filter_branches_and_tags(config, [*branches, *tags])
-        )
+        (display_name(bt), bt)
+        for bt in sort_branches_and_tags(config, bts, display_names)
     ]
 
     if config.vs_current_version:
@@ -77,6 +102,7 @@ def execute(config: Config, git: Git, sphinx: Sphinx):
         for name, bt in combined_with_name:
             if config.vs_current_version in (name, bt.name):
                 primary_version = name
+                break
 
         assert (
             primary_version
@@ -84,19 +110,76 @@ def execute(config: Config, git: Git, sphinx: Sphinx):
     else:
         primary_version = combined_with_name[0][0]
 
-    built_paths: list[Path] = []
-    for name, bt in combined_with_name:
-        LOGGER.info("%s building...", name)
-        git.checkout(bt)
+    for name in manifest.keys() - {name for name, _ in combined_with_name}:
+        LOGGER.info("Removing '%s', which is no longer a version...", name)
+        if (build_path / name).exists():
+            removals.append(remove_in_background(build_path / name))
 
-        version_path = build_path / name
-        built_paths.append(version_path)
-        version_path.mkdir(exist_ok=True)
+    to_build: list[tuple[str, GitBranch | GitTag]] = []
+    for name, bt in combined_with_name:
+        # without a known hash, there's no telling whether a version changed
+        if (
+            bt.sha is not None
+            and manifest.get(name, {}).get("sha") == bt.sha
+            and (build_path / name).is_dir()
+            # a version whose build didn't finish still has sphinx's html folder
+            and not (build_path / name / "html").exists()
+        ):
+            LOGGER.info("%s is unchanged since the last build, skipping", name)
+        else:
+            to_build.append((name, bt))
+    built_paths = [build_path / name for name, _ in to_build]
+
+    # versions being built are left out of the manifest until they're done, so
+    # that a build which fails part way can't leave them looking up to date
+    rebuilding = {name for name, _ in to_build}
+    write_manifest(
+        build_path,
+        {
+            name: manifest[name]
+            for name, _ in combined_with_name
+            if name in manifest and name not in rebuilding
+        },
+    )
 
-        sphinx.build(version_path)
-        LOGGER.info("%s built", name)
+    def recreate_folder(path: Path):
+        if path.exists():
+            removals.append(remove_in_background(path))
+        path.mkdir(parents=True)
 
-    git.checkout_branch(original_branch)
+    # these are all independent, blocking file system calls, so they're done
+    # together up front instead of one at a time between checkouts
+    LOGGER.info("Writing CSS and JS files...")
+    with ThreadPoolExecutor() as pool:
+        to_copy = ["choices.min.css", "choices.min.js", "versioned_sphinx.js"]
+        written = [
+            pool.submit(shutil.copyfile, STATIC_DIR / f, build_path / f)
+            for f in to_copy
+        ]
+        written.append(
+            pool.submit(write_control_css, config, verified.sphinx, build_path)
+        )
+        written.extend(pool.submit(recreate_folder, path) for path in built_paths)
+
+        for future in written:
+            future.result()
+
+    # each version is built from its own worktree, so the current checkout
+    # is never switched away from and its state doesn't matter
+    worktrees = Path(mkdtemp(prefix="versioned-sphinx-"))
+    # worktrees hold the whole repository, which the repo folder may be within
+    prefix = git.get_prefix()
+    try:
+        for i, ((name, bt), version_path) in enumerate(zip(to_build, built_paths)):
+            LOGGER.info("%s building...", name)
+            worktree = git.add_worktree(bt, worktrees / str(i))
+            try:
+                sphinx.build(version_path, config.vs_jobs, worktree / prefix)
+            finally:
+                git.remove_worktree(worktree)
+            LOGGER.info("%s built", name)
+    finally:
+        shutil.rmtree(worktrees, ignore_errors=True)
 
     LOGGER.info("Consolidating HTML versions...")
     sphinx.consolidate_html_versions(built_paths)
@@ -105,46 +188,62 @@ def execute(config: Config, git: Git, sphinx: Sphinx):
     sphinx.write_root_html(build_path, primary_version)
 
     LOGGER.info("Writing version details...")
-    with open(build_path / "versioned_sphinx.js", "a", encoding="utf-8") as file:
-        file.write("\n\n")
-
-        file.write("FILES_PER_VERSION = ")
+    # a large buffer means the many small writes below reach the file in
+    # only a handful of actual writes
+    with open(
+        build_path / "versioned_sphinx.js", "a", buffering=1 << 20, encoding="utf-8"
+    ) as file:
+        # streamed a file name at a time, rather than building the whole
+        # mapping and its JSON in memory first
+        file.write("\n\nFILES_PER_VERSION = {")
+        for i, (name, _) in enumerate(combined_with_name):
+            file.write(", " if i else "")
+            file.write(to_json(name))
+            file.write(": [")
+            for j, html_file in enumerate(
+                sphinx.iter_html_file_names(build_path / name)
+            ):
+                file.write(", " if j else "")
+                file.write(to_json(html_file))
+            file.write("]")
+
+        # a shallow copy of each field, unlike asdict() which deep copies
+        versions = [
+            {
+                "display_name": name,
+                "primary": primary_version == name,
+                **{f: getattr(bt, f) for f in _field_names(bt)},
+            }
+            for name, bt in combined_with_name
+        ]
         file.write(
-            json.dumps(
-                {
-                    name: sphinx.get_html_file_names(path)
-                    for path, (name, _) in zip(built_paths, combined_with_name)
-                }
+            "".join(
+                (
+                    "};\n",
+                    f"THEME_INJECT_POINT = {verified.inject_location!r};\n",
+                    f"VERSIONS = {to_json(versions)};\n",
+                )
             )
         )
-        file.write(";\n")
 
-        file.write("THEME_INJECT_POINT = ")
-        if config.vs_inject_selector:
-            file.write(repr(config.vs_inject_selector))
-        else:
-            file.write(
-                repr(
-                    sphinx.get_theme_inject_location(sphinx.load_conf_file().html_theme)
-                )
+    LOGGER.info("Writing build manifest...")
+    built_at = datetime.now().isoformat()
+    write_manifest(
+        build_path,
+        {
+            name: (
+                {"sha": bt.sha, "built_at": built_at}
+                if build_path / name in built_paths
+                else manifest[name]
             )
-        file.write(";\n")
+            for name, bt in combined_with_name
+        },
+    )
 
-        file.write("VERSIONS = ")
-        file.write(
-            json.dumps(
-                [
-                    {
-                        "display_name": name,
-                        "primary": primary_version == name,
-                        **asdict(bt),
-                    }
-                    for name, bt in combined_with_name
-                ],
-                default=str,
-            )
-        )
-        file.write(";\n")
+    if any(removal.is_alive() for removal in removals):
+        LOGGER.info("Waiting for old builds to finish being removed...")
+    for removal in removals:
+        removal.join()
 
 
 def filter_branches_and_tags(
@@ -157,6 +256,23 @@ def filter_branches_and_tags(
     return bts
 
 
+def load_manifest(build_path: Path) -> dict[str, dict[str, str]]:
+    """Load the manifest written by the previous build in ``build_path``,
+    which maps each version's display name to the hash of the branch or tag
+    it was built from. An empty dict is returned if there isn't one.
+    """
+    path = build_path / MANIFEST_FILE
+    if not path.exists():
+        return {}
+
+    try:
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError) as e:
+        LOGGER.warning("Ignoring unreadable build manifest '%s': %s", path, e)
+        return {}
+
+
 def main():
     parser = argparse.ArgumentParser(
         "versioned-sphinx",
@@ -236,7 +352,19 @@ def main():
         ),
     )
 
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=lambda v: v if v == "auto" else int(v),
+        help=(
+            "The number of processes sphinx should use when building each "
+            + "version, or 'auto' to use one per CPU. This can also be defined "
+            + "with 'vs_jobs' in conf.py. Defaults to 'auto'."
+        ),
+    )
+
     args = parser.parse_args()
+    add_stream_handler()
 
     if args.repo:
         assert args.repo.exists(), f"Provided repo path '{args.repo}' does not exist"
@@ -266,6 +394,7 @@ def main():
             "vs_build_path": build,
             "vs_current_version": args.version,
             "vs_git_ref_location": args.location,
+            "vs_jobs": args.jobs,
             "vs_pattern": args.pattern,
         },
     )
@@ -284,59 +413,157 @@ def natural_sort_tuple(key: str) -> list[str | int]:
     into ``('v', 1, '.', 0)``, which will then sort correctly when compared
     with something like ``v10.0`` which gets converted to ``('v', 10, '.', 0)``.
     """
-    return [int(v) if v.isdigit() else v for v in NAT_SORT_PATTERN.split(key)]
+    parts: list[str | int] = NAT_SORT_PATTERN.split(key)  # type: ignore
+    # splitting on a single capture group means every odd part is a number
+    parts[1::2] = map(int, parts[1::2])
+    return parts
+
+
+def remove_in_background(path: Path) -> Thread:
+    """Remove a folder without waiting on it. The folder is renamed, which is
+    quick, so that ``path`` is immediately free to reuse, and is then deleted
+    on a new thread, which is returned so it can be joined.
+
+    The renamed folder stays beside ``path``, so if the process is stopped
+    before it's deleted, it's left behind for :func:`remove_leftovers`.
+    """
+    trash = path.with_name(f"{path.name}.old.{uuid4().hex[:8]}")
+    path.rename(trash)
+
+    removal = Thread(target=shutil.rmtree, args=(trash,))
+    removal.start()
+    return removal
+
+
+def remove_leftovers(build_path: Path) -> list[Thread]:
+    """Remove, in the background, any folders :func:`remove_in_background`
+    renamed but didn't get to delete, like when a previous run was interrupted.
+    These are either the whole build folder, beside ``build_path``, or a
+    version's folder, inside it.
+    """
+    leftovers = [
+        *(
+            path
+            for path in build_path.parent.glob(f"{glob.escape(build_path.name)}.old.*")
+            if re.fullmatch(re.escape(build_path.name) + _TRASH_SUFFIX, path.name)
+        ),
+        *(
+            path
+            for path in build_path.glob("*.old.*")
+            if re.fullmatch(".+" + _TRASH_SUFFIX, path.name)
+        ),
+    ]
+
+    removals = []
+    for path in leftovers:
+        if path.is_dir() and not path.is_symlink():
+            LOGGER.info("Removing '%s', left over from a previous build...", path)
+            removals.append(Thread(target=shutil.rmtree, args=(path,)))
+            removals[-1].start()
+    return removals
 
 
 def sort_branches_and_tags(
-    config: Config, bts: list[GitBranch | GitTag]
+    config: Config,
+    bts: list[GitBranch | GitTag],
+    display_names: dict[int, str] | None = None,
 ) -> list[GitBranch | GitTag]:
     """Sort the list of branches and tags using either
     :attr:`~versioned_sphinx.config.Config.vs_sort` or a natural sort
     performed on the name of the branch or tag (or the result of applying
     :attr:`~versioned_sphinx.config.Config.vs_display_name` if present).
+
+    :param display_names: Optionally, the already computed display name of
+        each branch or tag, keyed by ``id(bt)``, so that
+        :attr:`~versioned_sphinx.config.Config.vs_display_name` doesn't need
+        to be called again.
     """
     if config.vs_sort:
         return config.vs_sort(bts)
 
-    if config.vs_display_name:
-        key_to_value = [(config.vs_display_name(bt), bt) for bt in bts]
-    else:
-        key_to_value = [
-            (natural_sort_tuple(bt.name if isinstance(bt, GitBranch) else bt.name), bt)
+    if display_names is None:
+        display_names = {
+            id(bt): (config.vs_display_name(bt) if config.vs_display_name else bt.name)
             for bt in bts
-        ]
+        }
+
+    return sorted(
+        bts, key=lambda bt: natural_sort_tuple(display_names[id(bt)]), reverse=True
+    )
+
+
+def to_json(value: Any) -> str:
+    """Serialize ``value`` to a JSON string with dates in ISO format, using
+    `orjson <https://github.com/ijl/orjson>`_ if it's installed and falling
+    back to :mod:`json` otherwise.
+    """
+    if orjson is not None:
+        # orjson is compiled, so pylint can't see its members
+        return orjson.dumps(value).decode()  # pylint: disable=no-member
 
-    sort = sorted(key_to_value, key=lambda x: x[0], reverse=True)
-    return [kv[1] for kv in sort]
+    return json.dumps(value, default=datetime.isoformat)
 
 
-def verify_configuration(config: Config, git: Git, sphinx: Sphinx):
-    """Verify via assertions that required parameters are available"""
+def verify_configuration(config: Config, git: Git, sphinx: Sphinx) -> VerifiedContext:
+    """Verify via assertions that required parameters are available,
+    returning everything looked up along the way so it can be reused.
+    """
+    context = sphinx.get_context()
+    branches, tags = git.get_refs(config.vs_pattern, config.vs_git_ref_location)
+    LOGGER.info("Matched branches: %s", [b.name for b in branches])
+    LOGGER.info("Matched tags: %s", [t.name for t in tags])
 
-    conf = sphinx.load_conf_file()
-    assert hasattr(conf, "html_theme"), "'html_theme' must be defined in 'conf.py'"
-    theme = conf.html_theme
-    assert (
-        config.vs_inject_selector is not None
-        or sphinx.get_theme_inject_location(theme) is not None
-    ), (
+    theme = context.theme
+    inject_location = config.vs_inject_selector or context.inject_location
+    assert inject_location is not None, (
         f"Theme '{theme}' does not have a pre-defined inject "
         + "location and none was provided via 'vs_inject_selector'"
     )
-    LOGGER.info(
-        "Theme '%s' inject location: '%s'",
-        theme,
-        config.vs_inject_selector or sphinx.get_theme_inject_location(theme),
-    )
+    LOGGER.info("Theme '%s' inject location: '%s'", theme, inject_location)
 
-    assert config.vs_control_css is not None or sphinx.get_theme_css_file(theme), (
+    assert config.vs_control_css is not None or context.theme_css_file, (
         f"Theme '{theme}' does not have a pre-defined CSS file "
         + "and none was provided via 'vs_control_css'"
     )
 
-    assert git.get_branches(config.vs_pattern, config.vs_git_ref_location) or git.get_tags(
-        config.vs_pattern
-    ), "No branches or tags found meeting requirements"
+    assert branches or tags, "No branches or tags found meeting requirements"
+    return VerifiedContext(context, inject_location, branches, tags)
+
+
+def write_control_css(config: Config, context: SphinxContext, build_path: Path):
+    """Write the CSS which styles the version control to the build folder,
+    either from :attr:`~versioned_sphinx.config.Config.vs_control_css` or
+    the CSS file provided for the theme.
+    """
+    if config.vs_control_css:
+        # a string is a path if it names a CSS file, otherwise it's CSS itself
+        if isinstance(config.vs_control_css, Path) or config.vs_control_css.endswith(
+            ".css"
+        ):
+            p = Path(config.vs_control_css)
+            if not p.is_absolute():
+                p = (context.conf_path.parent / p).resolve()
+
+            shutil.copyfile(p, build_path / "versioned_sphinx.css")
+        else:
+            with open(
+                build_path / "versioned_sphinx.css", "w", encoding="utf-8"
+            ) as file:
+                file.write(config.vs_control_css)
+    else:
+        shutil.copyfile(
+            # verify_configuration makes sure this path exists
+            context.theme_css_file,  # type: ignore
+            build_path / "versioned_sphinx.css",
+        )
+
+
+def write_manifest(build_path: Path, manifest: dict[str, dict[str, str]]):
+    """Write the manifest which lets the next build skip versions whose
+    branch or tag hasn't changed. See :func:`load_manifest`.
+    """
+    with open(build_path / MANIFEST_FILE, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2)
 
 
 if __name__ == "__main__":
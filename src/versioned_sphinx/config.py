@@ -1,8 +1,7 @@
 from dataclasses import dataclass
-from datetime import datetime
 from pathlib import Path
 from types import ModuleType
-from typing import Callable, Literal
+from typing import Any, Callable, Literal
 from versioned_sphinx.git import GitBranch, GitTag
 from versioned_sphinx.logger import get_logger
 
@@ -11,6 +10,34 @@ LOGGER = get_logger("config")
 DisplayName = Callable[[GitBranch | GitTag], str]
 Filter = Callable[[GitBranch | GitTag], bool]
 Sort = Callable[[list[GitBranch | GitTag]], list[GitBranch | GitTag]]
+_LOCATIONS = ("all", "local", "remote")
+_ATTRIBUTES: tuple[tuple[str, Callable[[Any], bool], str], ...] = (
+    (
+        "vs_build_path",
+        lambda v: isinstance(v, (Path, str)),
+        "must be a Path or string",
+    ),
+    (
+        "vs_control_css",
+        lambda v: isinstance(v, (Path, str)),
+        "must be a Path or string",
+    ),
+    ("vs_current_version", lambda v: isinstance(v, str), "must be a string"),
+    ("vs_display_name", callable, "must be callable"),
+    ("vs_filter", callable, "must be callable"),
+    ("vs_git_ref_location", lambda v: v in _LOCATIONS, f"must be in {_LOCATIONS!r}"),
+    ("vs_inject_selector", lambda v: isinstance(v, str), "must be a string"),
+    (
+        "vs_jobs",
+        lambda v: v == "auto" or (isinstance(v, int) and v > 0),
+        "must be a positive integer or 'auto'",
+    ),
+    ("vs_pattern", lambda v: isinstance(v, str), "must be a string"),
+    ("vs_sort", callable, "must be callable"),
+)
+"""Each attribute :meth:`Config.parse` looks for, along with a check its
+value must pass and a description of that requirement for the error.
+"""
 
 
 @dataclass
@@ -27,6 +54,7 @@ class Config:
     vs_control_css: Path | str | None = None
     """A string containing CSS or a file path (absolute or relative to 'conf.py')
     to a CSS file which indicates how the version selector should be styled.
+    A string is treated as a path when it ends with ``.css``.
     CSS is provided by default for certain themes, any listed in 
     :attr:`~versioned_sphinx.sphinx.THEME_INJECT_POINT`, but that can be overridden
     or provided for an unsupported theme using this attribute.
@@ -97,6 +125,12 @@ class Config:
     Example: ``div.navigation > nav``
     """
 
+    vs_jobs: int | Literal["auto"] = "auto"
+    """The number of processes sphinx should use when building each version,
+    passed along as ``sphinx-build -j``. By default, this is ``'auto'`` which
+    uses one process per CPU. Set this to ``1`` to build serially.
+    """
+
     vs_pattern: str | None = None
     """A glob-style pattern to use when searching for branches and tags.
     Basic pattern matching like wildcards can be used here. For more complex
@@ -127,58 +161,13 @@ class Config:
         attributes take precedence.
         """
         c = Config()
+        attributes = vars(conf)
 
-        def get_attr(name: str):
-            if hasattr(conf, name):
-                return getattr(conf, name)
-            if name in command_line:
-                return command_line[name]
-
-            return None
-
-        if (vs_build_path := get_attr("vs_build_path")) is not None:
-            assert isinstance(
-                vs_build_path, (Path, str)
-            ), "'vs_build_path' must be a Path or string"
-            c.vs_build_path = vs_build_path
-
-        if (vs_control_css := get_attr("vs_control_css")) is not None:
-            assert isinstance(vs_control_css, (Path, str)), "'vs_control_css' must be a Path or string"
-            c.vs_control_css = vs_control_css
-
-        if (vs_current_version := get_attr("vs_current_version")) is not None:
-            assert isinstance(
-                vs_current_version, str
-            ), "'vs_current_version' must be a string"
-            c.vs_current_version
-
-        if (vs_display_name := get_attr("vs_display_name")) is not None:
-            assert callable(vs_display_name), "'vs_display_name' must be callable"
-            c.vs_display_name = vs_display_name
-
-        if (vs_filter := get_attr("vs_filter")) is not None:
-            assert callable(vs_filter), "'vs_filter' must be callable"
-            assert isinstance(
-                vs_filter(GitTag(datetime.now(), "test")), bool
-            ), "'vs_filter' must return a bool"
-            c.vs_filter = vs_filter
-
-        if (vs_git_ref_location := get_attr("vs_git_ref_location")) is not None:
-            locs = ('all', 'local', 'remote')
-            assert vs_git_ref_location in locs, f"'vs_git_ref_location' must be in {repr(locs)}"
-            c.vs_git_ref_location = vs_git_ref_location
-
-        if (vs_inject_selector := get_attr("vs_inject_selector")) is not None:
-            assert isinstance(vs_inject_selector, str), "'vs_inject_selector' must be a string"
-            c.vs_inject_selector = vs_inject_selector
-
-        if (vs_pattern := get_attr("vs_pattern")) is not None:
-            assert isinstance(vs_pattern, str), "'vs_pattern' must be a string"
-            c.vs_pattern = vs_pattern
-
-        if (vs_sort := get_attr("vs_sort")) is not None:
-            assert callable(vs_sort), "'vs_sort' must be callable"
-            c.vs_sort = vs_sort
+        for name, is_valid, requirement in _ATTRIBUTES:
+            value = attributes[name] if name in attributes else command_line.get(name)
+            if value is not None:
+                assert is_valid(value), f"'{name}' {requirement}"
+                setattr(c, name, value)
 
         LOGGER.debug("Final config is %s", c)
         return c
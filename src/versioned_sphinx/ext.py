@@ -1,4 +1,5 @@
-from pathlib import Path
+from os import scandir
+from os.path import dirname
 from sphinx.application import Sphinx
 from sphinx.util.typing import ExtensionMetadata
 from .logger import get_logger
@@ -13,14 +14,18 @@ def setup(app: Sphinx) -> ExtensionMetadata:
     This function ensures that the appropriate CSS and JS files get
     added to the build.
     """
-    parent_dir = Path(app.outdir).parent
+    # the shared files live in the overall build folder, which holds each
+    # version's folder, which in turn holds sphinx's 'html' output folder
+    parent_dir = dirname(dirname(app.outdir))
     LOGGER.info("Adding CSS and JS files from '%s'", parent_dir)
 
-    for file in parent_dir.iterdir():
-        if file.suffix == ".css":
-            app.add_css_file(f"../../{file.name}")
-        elif file.suffix == ".js":
-            app.add_js_file(f"../../{file.name}")
+    with scandir(parent_dir) as entries:
+        for entry in entries:
+            name = entry.name
+            if name.endswith(".css"):
+                app.add_css_file(f"../../{name}")
+            elif name.endswith(".js"):
+                app.add_js_file(f"../../{name}")
 
     return {
         "parallel_read_safe": True,
@@ -3,16 +3,28 @@ tags which should be used when generating the various versions
 of the documentation.
 """
 
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime
+from fnmatch import translate
+from os import fspath
+from os.path import isdir
 from pathlib import Path
-from typing import Literal
+from tempfile import TemporaryFile
+from threading import Lock
+from typing import Iterator, Literal
+import logging
+import re
 import subprocess
 from versioned_sphinx.logger import get_logger
 
 
 __all__ = ["Git", "GitBranch", "GitTag"]
 LOGGER = get_logger("git")
+_READ_ONLY = ["git", "--no-optional-locks"]
+"""The start of git commands which only read from the repo, so that they don't
+take locks (like on the index) which they could do without
+"""
 
 
 class Git:
@@ -20,11 +32,58 @@ class Git:
     and change to specific branches or tags to allow generating the docs.
     """
 
+    _STATUS_ARGS = [
+        "status",
+        "--porcelain=v2",
+        "--branch",
+        "--untracked-files=no",
+        "-z",
+    ]
+    """Arguments used to check the current branch and hash of the repo"""
+    _BUFFER_SIZE = 1 << 16
+    """Size of the buffer used when reading the output of git commands"""
+
     def __init__(self, repo_path: Path | str):
-        self._repo = Path(repo_path).expanduser().resolve()
+        repo = Path(repo_path).expanduser()
+        # resolving walks every part of the path, which an existing absolute
+        # folder doesn't need
+        if not (repo.is_absolute() and isdir(repo)):
+            repo = repo.resolve()
+
+        self._repo = repo
+        self._repo_str = fspath(repo)
+        self._refs_cache: dict[
+            tuple[str | None, tuple[str, ...]], tuple[list[GitBranch], list[GitTag]]
+        ] = {}
+        self._status_cache: tuple[str, str] | None = None
+        self._batch = _GitBatch(self._repo_str)
         LOGGER.debug("Looking for git repo in %s", self._repo)
         self._verify_repo()
 
+    def __del__(self):
+        self.close()
+
+    def add_worktree(self, branch_or_tag: "GitBranch | GitTag", path: Path) -> Path:
+        """Check out a specific branch or tag into a new, detached worktree at
+        ``path``, leaving the current checkout of the repository untouched.
+        The worktree should be removed with :meth:`remove_worktree` once it's
+        no longer needed.
+        """
+        assert isinstance(
+            branch_or_tag, (GitBranch, GitTag)
+        ), "Argument must be GitBranch or GitTag"
+
+        self._execute_git_command(
+            [
+                "worktree",
+                "add",
+                "--detach",
+                str(path),
+                branch_or_tag.sha or branch_or_tag.name,
+            ]
+        )
+        return path
+
     def checkout(self, branch_or_tag: "GitBranch | GitTag"):
         """Checkout the current repository to a specific branch or tag"""
         assert isinstance(
@@ -38,37 +97,55 @@ class Git:
 
     def checkout_branch(self, branch: "GitBranch | str"):
         """Checkout the current repository to specific branch"""
-        self._verify_nothing_pending()
-
         name = branch.name if isinstance(branch, GitBranch) else branch
-        branches = self.get_branches(location="local")
-        args: list[str] = ["checkout"]
+        if self.get_current_branch() == name:
+            return
+
+        # both are independent git calls, so they're waited on together
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            pending = executor.submit(self._verify_nothing_pending)
+            local = executor.submit(self._batch.query, f"refs/heads/{name}")
+            pending.result()
+            exists = local.result() is not None
 
-        if any(b.name == name for b in branches):
+        args: list[str] = ["checkout"]
+        if exists:
             args.append(name)
         else:
             args.extend(("-b", name))
 
         self._execute_git_command(args)
+        self._invalidate_caches()
 
     def checkout_tag(self, tag: "GitTag | str"):
         """Checkout the current repository to a specific tag"""
-        self._verify_nothing_pending()
-
         name = tag.name if isinstance(tag, GitTag) else tag
+        # peeled to the commit, since annotated tags are objects of their own
+        commit = self._batch.query(f"refs/tags/{name}^{{commit}}")
+        if commit is not None and commit[0] == self.get_current_hash():
+            return
+
+        self._verify_nothing_pending()
         self._execute_git_command(["checkout", name])
+        self._invalidate_caches()
+
+    def close(self):
+        """Stop the long-running git process used for looking up objects, if
+        one was started. It is started again if it's needed afterwards.
+        """
+        # the batch may not exist if __init__ failed before creating it
+        batch = getattr(self, "_batch", None)
+        if batch is not None:
+            batch.close()
 
     def get_current_branch(self) -> str:
-        """Get the name of the current branch in the repo"""
-        response = self._execute_git_command(["status"]).strip()
-        first_line = response.splitlines()[0]
-        if first_line.startswith("On branch "):
-            return first_line.split("On branch ")[-1].strip()
-        elif first_line.startswith("HEAD detached at "):
-            return first_line.split("HEAD detached at ")[-1].strip()
-        else:
-            LOGGER.error("Unknown checkout: '%s'", first_line)
-            raise ValueError("Unknown checkout point")
+        """Get the name of the current branch in the repo. When the repo is in
+        a detached HEAD state, the hash of the checked-out commit is returned.
+        """
+        head, sha = self._status_v2()
+        if head == "(detached)":
+            return sha
+        return head
 
     def get_current_hash(self) -> str:
         """Get the hash of the most recent commit of the currently
@@ -77,8 +154,7 @@ class Git:
         >>> git.get_current_hash()
         'cff3eba74bf40e62331be14a9cafe2b152cb16bb'
         """
-        response = self._execute_git_command(["rev-parse", "HEAD"])
-        return response.strip()
+        return self._status_v2()[1]
 
     def get_branches(
         self,
@@ -88,100 +164,305 @@ class Git:
         """Get all of the branches in the current repo (or just those
         which match ``pattern``).
         """
-        spaces = 5
-        args = [
-            "branch",
-            f"--format='%(creatordate:iso-strict){' ' * spaces}%(refname:strip=2){' ' * spaces}%(upstream:strip=2)'",
-        ]
-        if location == "all":
-            args.append("-a")
-        elif location == "remote":
-            args.append("-r")
-
-        if pattern:
-            args.append("-l")
-            args.append(pattern)
-
-        response = self._execute_git_command(args)
-        branches: list[GitBranch] = []
-        for line in response.splitlines():
-            if line[0] == "'":
-                line = line[1:]
-            if line[-1] == "'":
-                line = line[:-1]
-
-            parts = line.strip().split(" " * spaces)
-            time_string, branch_name = parts[:2]
-            remote = len(parts) == 2
-
-            branches.append(
-                GitBranch(
-                    name=branch_name,
-                    date=datetime.strptime(time_string, "%Y-%m-%dT%H:%M:%S%z"),
-                    remote=remote,
-                )
-            )
+        return self.get_refs(pattern, location)[0]
+
+    def get_prefix(self) -> str:
+        """Get the path of the repo folder relative to the top level of the
+        git repository, which is empty unless the repo folder is a subfolder of
+        it (like a project in a monorepo). Worktrees contain the whole
+        repository, so this is where the repo folder is within them.
+
+        >>> git.get_prefix()
+        'packages/docs/'
+        """
+        return self._execute_git_command(["rev-parse", "--show-prefix"], read_only=True)
+
+    def get_refs(
+        self,
+        pattern: str | None = None,
+        location: Literal["all", "local", "remote"] = "remote",
+    ) -> tuple[list["GitBranch"], list["GitTag"]]:
+        """Get all of the branches and tags in the current repo (or just those
+        which match ``pattern``) with a single git command.
+        :meth:`get_branches` and :meth:`get_tags` are both built on this.
 
-        return branches
+        The result is cached until the repository is checked out to something
+        else, so repeated calls don't list the refs again.
+
+        >>> branches, tags = git.get_refs("v*", location="all")
+        """
+        prefixes = ["refs/tags/"]
+        if location in ("all", "local"):
+            prefixes.append("refs/heads/")
+        if location in ("all", "remote"):
+            prefixes.append("refs/remotes/")
+
+        return self._get_cached_refs(pattern, tuple(prefixes))
 
     def get_tags(self, pattern: str | None = None) -> list["GitTag"]:
         """Get all of the tags in the current repo (or just those which
         match ``pattern``).
         """
-        spaces = 5
-        args = [
-            "tag",
-            f"--format='%(creatordate:iso-strict){' ' * spaces}%(refname:strip=2)'",
-        ]
-        if pattern:
-            args.append("-l")
-            args.append(pattern)
-
-        response = self._execute_git_command(args)
-        tags: list[GitTag] = []
-        for line in response.splitlines():
-            if line[0] == "'":
-                line = line[1:]
-            if line[-1] == "'":
-                line = line[:-1]
-
-            time_string, tag_name = line.strip().split(" " * spaces)
-            tags.append(
-                GitTag(datetime.strptime(time_string, "%Y-%m-%dT%H:%M:%S%z"), tag_name)
-            )
+        return self._get_cached_refs(pattern, ("refs/tags/",))[1]
 
-        return tags
+    def remove_worktree(self, path: Path):
+        """Remove a worktree previously created with :meth:`add_worktree`"""
+        self._execute_git_command(["worktree", "remove", "--force", str(path)])
 
-    def _execute_git_command(self, args: list[str]) -> str:
-        """Execute a git command in the current repo, returning stdout."""
-        response = subprocess.run(
-            ["git", *args], capture_output=True, check=True, cwd=self._repo
-        )
+    def _execute_git_command(self, args: list[str], read_only: bool = False) -> str:
+        """Execute a git command in the current repo, returning stdout. If the
+        command is ``read_only``, it doesn't take optional locks.
+        """
+        response = self._execute_git_command_bytes(args, read_only)
 
         try:
-            stdout = response.stdout.decode().strip()
-            LOGGER.debug(
-                "command 'git %s' in '%s' yielded '%s'",
-                " ".join(args),
-                self._repo,
-                stdout.replace("\n", " "),
-            )
+            stdout = response.decode().strip()
+            if LOGGER.isEnabledFor(logging.DEBUG):
+                LOGGER.debug(
+                    "command 'git %s' in '%s' yielded '%s'",
+                    " ".join(args),
+                    self._repo,
+                    stdout.replace("\n", " "),
+                )
             return stdout
         except UnicodeDecodeError as e:
             LOGGER.error("git command '%s' failed with error %s", " ".join(args), e)
             raise RuntimeError("Execution of git command failed")
 
+    def _execute_git_command_bytes(
+        self, args: list[str], read_only: bool = False
+    ) -> bytes:
+        """Execute a git command in the current repo, returning the raw bytes
+        of stdout without decoding them. See :meth:`_execute_git_command`.
+        """
+        response = subprocess.run(
+            [*(_READ_ONLY if read_only else ["git"]), *args],
+            capture_output=True,
+            check=True,
+            cwd=self._repo_str,
+        )
+        return response.stdout
+
+    def _get_cached_refs(
+        self, pattern: str | None, prefixes: tuple[str, ...]
+    ) -> tuple[list["GitBranch"], list["GitTag"]]:
+        """Get the branches and tags under ``prefixes`` which match ``pattern``,
+        listing them only if they aren't already cached
+        """
+        key = (pattern, prefixes)
+        if key not in self._refs_cache:
+            self._refs_cache[key] = self._list_refs(pattern, prefixes)
+
+        # copies, so that callers can't modify what's cached
+        branches, tags = self._refs_cache[key]
+        return list(branches), list(tags)
+
+    def _invalidate_caches(self):
+        """Forget everything cached about the state of the repository, after
+        something has changed it.
+        """
+        self._refs_cache.clear()
+        self._status_cache = None
+
+    def _iter_git_command_lines(
+        self, args: list[str], read_only: bool = False
+    ) -> Iterator[bytes]:
+        """Execute a git command in the current repo, yielding each line of
+        stdout as raw bytes as it's read, rather than first collecting all of
+        it in memory. See :meth:`_execute_git_command`.
+        """
+        command = [*(_READ_ONLY if read_only else ["git"]), *args]
+        # stderr goes to a file rather than a pipe, since a pipe which isn't
+        # read until stdout is done could fill up and block git
+        with TemporaryFile() as stderr_file, subprocess.Popen(
+            command,
+            bufsize=self._BUFFER_SIZE,
+            stdout=subprocess.PIPE,
+            stderr=stderr_file,
+            cwd=self._repo_str,
+        ) as process:
+            yield from process.stdout
+            process.wait()
+            stderr_file.seek(0)
+            stderr = stderr_file.read()
+
+        if process.returncode:
+            raise subprocess.CalledProcessError(
+                process.returncode, command, stderr=stderr
+            )
+
+    def _list_refs(
+        self, pattern: str | None, prefixes: tuple[str, ...]
+    ) -> tuple[list["GitBranch"], list["GitTag"]]:
+        """List the branches and tags under ``prefixes`` (like ``refs/tags/``)
+        for :meth:`_get_cached_refs`, without caching
+        """
+        # the output is parsed as bytes and only the fields of matching refs
+        # are decoded, since repos can have a great many refs
+        lines = self._iter_git_command_lines(
+            [
+                "for-each-ref",
+                "--format=%(creatordate:iso-strict)%00%(objectname)%00%(refname)",
+                *prefixes,
+            ],
+            read_only=True,
+        )
+        matches = re.compile(translate(pattern).encode()).match if pattern else None
+
+        branches: list[GitBranch] = []
+        tags: list[GitTag] = []
+        for line in lines:
+            # fields are NUL separated, which can't appear in any of them.
+            # for-each-ref has no -z, but ref names can't contain newlines
+            time_string, sha, ref = line.rstrip(b"\n").split(b"\0")
+            kind, name = ref.split(b"/", 2)[1:]
+            if matches and not matches(name):
+                continue
+
+            # older versions of fromisoformat don't accept a "Z" UTC offset
+            date = datetime.fromisoformat(time_string.decode().replace("Z", "+00:00"))
+            if kind == b"tags":
+                tags.append(GitTag(date, name.decode(), sha.decode()))
+            else:
+                branches.append(
+                    GitBranch(
+                        date=date,
+                        name=name.decode(),
+                        remote=kind == b"remotes",
+                        sha=sha.decode(),
+                    )
+                )
+
+        return branches, tags
+
+    def _parse_status_v2(self, response: bytes) -> tuple[str, str]:
+        """Parse the output of ``git status --porcelain=v2 --branch -z`` into
+        the current branch (or ``(detached)``) and the current hash.
+        """
+        head = sha = ""
+        for entry in response.split(b"\0"):
+            if entry.startswith(b"# branch.head "):
+                head = entry[len(b"# branch.head ") :].decode()
+            elif entry.startswith(b"# branch.oid "):
+                sha = entry[len(b"# branch.oid ") :].decode()
+
+        return head, sha
+
+    def _status_v2(self) -> tuple[str, str]:
+        """Get the current branch and current hash from a single ``git status``
+        call. The result is cached until the repository is checked out to
+        something else.
+        """
+        if self._status_cache is None:
+            self._status_cache = self._parse_status_v2(
+                self._execute_git_command_bytes(self._STATUS_ARGS, read_only=True)
+            )
+        return self._status_cache
+
     def _verify_nothing_pending(self):
         """Raise an error if the repo has any uncommitted changes"""
-        response = self._execute_git_command(["status"])
-        assert (
-            "nothing to commit, working tree clean" in response
-        ), f"Repository has uncommitted changes: {response}"
+        # refreshed first so files which were only touched don't count as changed
+        subprocess.run(
+            ["git", "update-index", "-q", "--refresh"],
+            capture_output=True,
+            check=False,
+            cwd=self._repo_str,
+        )
+        response = subprocess.run(
+            [*_READ_ONLY, "diff-index", "--quiet", "HEAD", "--"],
+            check=False,
+            cwd=self._repo_str,
+        )
+        assert response.returncode == 0, "Repository has uncommitted changes"
 
     def _verify_repo(self):
         """Raise an error if the current path isn't actually a git repository"""
-        response = self._execute_git_command(["status"])
-        assert "not a git repository" not in response, "Folder is not a git repository"
+        # the exit status is used rather than the message, which is localized
+        response = subprocess.run(
+            [*_READ_ONLY, "rev-parse", "--git-dir"],
+            capture_output=True,
+            check=False,
+            cwd=self._repo_str,
+        )
+        assert response.returncode == 0, "Folder is not a git repository"
+
+
+class _GitBatch:
+    """A long-running ``git cat-file --batch-check`` process which looks up
+    objects over stdin/stdout, so that each lookup doesn't have to start a new
+    git process. The process is started on the first lookup.
+    """
+
+    def __init__(self, repo: str):
+        self._repo = repo
+        self._process: subprocess.Popen | None = None
+        self._lock = Lock()
+
+    def close(self):
+        """Stop the git process, if it's running"""
+        with self._lock:
+            self._stop()
+
+    def query(self, rev: str) -> tuple[str, str] | None:
+        """Get the hash and type of the object ``rev`` refers to, or ``None``
+        if it doesn't exist.
+
+        >>> batch.query("refs/tags/v1.0")
+        ('cff3eba74bf40e62331be14a9cafe2b152cb16bb', 'tag')
+        """
+        with self._lock:
+            response = self._ask(rev)
+            if not response:
+                # the process exited at some point since it was started, so it's
+                # started again, but only once
+                self._stop()
+                response = self._ask(rev)
+
+        if not response:
+            raise RuntimeError(
+                f"'git cat-file --batch-check' in '{self._repo}' exited unexpectedly"
+            )
+
+        name, status = response.rsplit(" ", 1)
+        if status in ("missing", "ambiguous"):
+            return None
+        return name, status
+
+    def _ask(self, rev: str) -> str:
+        """Send ``rev`` to the git process, starting it if needed, and get the
+        line it responds with, or an empty string if the process has exited
+        """
+        if self._process is None:
+            self._process = subprocess.Popen(
+                [
+                    *_READ_ONLY,
+                    "cat-file",
+                    "--batch-check=%(objectname) %(objecttype)",
+                ],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                bufsize=-1,
+                text=True,
+                cwd=self._repo,
+            )
+
+        try:
+            self._process.stdin.write(f"{rev}\n")
+            self._process.stdin.flush()
+        except BrokenPipeError:
+            return ""
+        return self._process.stdout.readline().rstrip("\n")
+
+    def _stop(self):
+        """Stop the git process, if there is one, without taking the lock"""
+        if self._process is not None:
+            try:
+                self._process.stdin.close()
+            except BrokenPipeError:
+                pass
+            self._process.wait()
+            self._process.stdout.close()
+            self._process = None
 
 
 @dataclass
@@ -194,6 +475,8 @@ class GitBranch:
     """The name of the branch (including the origin)"""
     remote: bool
     """Whether the branch is remote or not"""
+    sha: str | None = None
+    """The hash of the commit the branch points to, if known"""
 
 
 @dataclass
@@ -204,3 +487,7 @@ class GitTag:
     """The date and time when the tag was created"""
     name: str
     """The name of the tag"""
+    sha: str | None = None
+    """The hash of the tag, if known. For an annotated tag this is the hash of
+    the tag object itself, not of the commit it points to.
+    """
@@ -5,12 +5,26 @@ import logging
 
 ROOT_LOGGER = logging.getLogger("versioned-sphinx")
 ROOT_LOGGER.setLevel(environ.get("LOG", "INFO").upper())
-_handler = logging.StreamHandler(stream=stdout)
-_handler.setFormatter(
-    logging.Formatter("%(asctime)s - %(levelname)s - %(name)s - %(message)s")
-)
-ROOT_LOGGER.addHandler(_handler)
+# nothing is printed unless asked for with LOG, or by the command line tool,
+# letting applications use versioned_sphinx with their own handlers
+ROOT_LOGGER.addHandler(logging.NullHandler())
+
+
+def add_stream_handler():
+    """Print the messages of :data:`ROOT_LOGGER` to stdout, if they aren't
+    already being printed
+    """
+    if not any(isinstance(h, logging.StreamHandler) for h in ROOT_LOGGER.handlers):
+        handler = logging.StreamHandler(stream=stdout)
+        handler.setFormatter(
+            logging.Formatter("%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+        )
+        ROOT_LOGGER.addHandler(handler)
 
 
 def get_logger(name: str) -> logging.Logger:
     return ROOT_LOGGER.getChild(name)
+
+
+if "LOG" in environ:
+    add_stream_handler()
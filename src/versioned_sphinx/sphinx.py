@@ -2,17 +2,31 @@
 file, determining build location, and actually executing the build.
 """
 
-from os import walk
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from importlib.util import module_from_spec, spec_from_file_location
+from os import replace, scandir
+from os.path import join
 from pathlib import Path
 from types import ModuleType
-import importlib
+from typing import ClassVar, Iterator, Literal
+import logging
+import os
 import shutil
 import subprocess
-import sys
 from versioned_sphinx.logger import get_logger
 
 
 LOGGER = get_logger("sphinx")
+STATIC_DIR = Path(__file__).resolve().parent / "static"
+"""The folder of static CSS and JS files shipped with :mod:`versioned_sphinx`"""
+_AVAILABLE_THEMES = (
+    frozenset(p.stem for p in STATIC_DIR.glob("*.css"))
+    if STATIC_DIR.exists()
+    else frozenset()
+)
+"""The themes which have a CSS file in :data:`STATIC_DIR`"""
 REDIRECT_HTML = """
 <!DOCTYPE html>
 <html>
@@ -24,6 +38,9 @@ REDIRECT_HTML = """
     </body>
 </html>
 """
+_REDIRECT_PREFIX, _REDIRECT_SUFFIX = (
+    part.encode("utf-8") for part in REDIRECT_HTML.split("{primary_version}")
+)
 
 THEME_INJECT_POINT: dict[str, str] = {
     "alabaster": "div.body > section > h1",
@@ -35,11 +52,32 @@ element.
 """
 
 
+@dataclass(frozen=True, slots=True)
+class SphinxContext:
+    """Details about the sphinx project which are needed throughout
+    a build, gathered once with :meth:`Sphinx.get_context`.
+    """
+
+    conf_module: ModuleType
+    """The imported 'conf.py' file"""
+    conf_path: Path
+    """The filepath of 'conf.py'"""
+    theme: str
+    """The ``html_theme`` defined in 'conf.py'"""
+    inject_location: str | None
+    """The pre-defined inject location for :attr:`theme`, if there is one"""
+    theme_css_file: Path | None
+    """The CSS file provided for :attr:`theme`, if there is one"""
+
+
 class Sphinx:
     """Mechanisms related to interacting with sphinx like actually
     executing a build, finding the 'conf.py' file, and so forth.
     """
 
+    _CONF_CACHE: ClassVar[dict[Path, Path]] = {}
+    """The 'conf.py' found for each repo folder, so it's only searched for once"""
+
     def __init__(self, repo_path: Path | str, conf_path: Path | str | None = None):
         """Construct a new :class:`Sphinx` instance pointing at
         a project with sphinx already configured.
@@ -51,56 +89,95 @@ class Sphinx:
         """
         self._repo_dir = Path(repo_path)
         conf: Path | None = None
+        # resolved, so the same repo is found however it was referred to
+        cache_key = self._repo_dir.resolve()
 
         if conf_path:
             conf = Path(conf_path)
             assert conf.exists(), f"'conf.py' path of '{conf}' does not exist"
+            self._CONF_CACHE.pop(cache_key, None)
+        elif cache_key in self._CONF_CACHE:
+            conf = self._CONF_CACHE[cache_key]
         else:
             docs_path = self._repo_dir / "docs"
             assert (
                 docs_path.exists()
             ), f"'docs' folder does not exist in '{self._repo_dir}'"
 
-            for root, _, filenames in walk(docs_path):
-                for filename in filenames:
-                    if filename == "conf.py":
-                        conf = Path(root) / filename
-                        break
-
-                if conf is not None:
-                    break
-
+            conf = next(docs_path.rglob("conf.py"), None)
             assert (
                 conf is not None
             ), f"Could not find 'conf.py' any where under '{docs_path}'"
             LOGGER.debug("Resolved 'conf.py' to %s", conf)
+            self._CONF_CACHE[cache_key] = conf
 
         self._cached_conf: ModuleType | None = None
         self._conf_file = conf
         self._source_dir = conf.parent
 
-    def build(self, output: Path):
-        """Build the current sphinx project to a specific folder"""
-        LOGGER.debug("Building '%s' to '%s'", self._source_dir, output)
+    def build(
+        self,
+        output: Path,
+        jobs: int | Literal["auto"] | None = None,
+        checkout: Path | None = None,
+    ):
+        """Build the current sphinx project to a specific folder
+
+        :param output: The folder to build into
+        :param jobs: Optionally, the number of processes sphinx should use
+            to read and write the project in parallel, or ``'auto'`` to use
+            one per CPU.
+        :param checkout: Optionally, another checkout of ``repo_path``, like
+            the same folder within a worktree, to build the project from
+            instead. The project is expected to be at the same place within it.
+        """
+        source = self._source_dir
+        if checkout is not None:
+            try:
+                source = checkout / source.resolve().relative_to(
+                    self._repo_dir.resolve()
+                )
+            except ValueError as e:
+                raise AssertionError(
+                    f"'{source}' must be within '{self._repo_dir}' to build "
+                    + "other checkouts of it"
+                ) from e
+
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            LOGGER.debug("Building '%s' to '%s'", source, output)
+        args = ["sphinx-build", "-M", "html", str(source), str(output)]
+        if jobs is not None:
+            args.extend(("-j", str(jobs)))
+
+        # the output is streamed rather than collected, keeping only enough
+        # of the end of it to explain a failure
+        saw_success = False
+        tail: deque[str] = deque(maxlen=50)
         try:
-            response = subprocess.run(
-                ["sphinx-build", "-M", "html", str(self._source_dir), str(output)],
-                capture_output=True,
-                check=True,
-            )
+            with subprocess.Popen(
+                args,
+                bufsize=1 << 16,
+                close_fds=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+            ) as process:
+                for line in process.stdout:
+                    saw_success = saw_success or "build succeeded" in line
+                    tail.append(line.rstrip("\n"))
         except FileNotFoundError as e:
             LOGGER.error("Error during build. Are you sure sphinx is installed?")
             raise e
-        except subprocess.CalledProcessError as e:
+
+        if process.returncode:
             LOGGER.error(
                 "Error during build. Are you sure all themes and extensions are installed?"
             )
-            raise e
+            raise subprocess.CalledProcessError(
+                process.returncode, args, output="\n".join(tail)
+            )
 
-        stdout = response.stdout.decode()
-        assert (
-            "build succeeded" in stdout
-        ), f"Build did not succeed: {stdout.replace('\n', ' ')}"
+        assert saw_success, "Build did not succeed: " + " ".join(tail)
 
     @staticmethod
     def consolidate_html_versions(versions: list[Path]):
@@ -119,21 +196,46 @@ class Sphinx:
 
                 <files>
         """
+        if not versions:
+            return
+
         for v in versions:
             doctrees = v / "doctrees"
-            LOGGER.debug("Removing '%s'...", doctrees)
+            if LOGGER.isEnabledFor(logging.DEBUG):
+                LOGGER.debug("Removing '%s'...", doctrees)
             shutil.rmtree(doctrees)
 
-            html = v / "html"
-            LOGGER.debug("Moving '%s' -> '%s'...", html, v)
-            for item in html.iterdir():
-                if item.is_file():
-                    item.rename(v / item.name)
-                else:
-                    shutil.move(item, v / item.name)
+        def move_up(v: str):
+            html = join(v, "html")
+            if LOGGER.isEnabledFor(logging.DEBUG):
+                LOGGER.debug("Moving '%s' -> '%s'...", html, v)
+            with scandir(html) as entries:
+                for entry in entries:
+                    replace(entry.path, join(v, entry.name))
 
             shutil.rmtree(html)
 
+        # each version is independent, and renames are I/O bound
+        with ThreadPoolExecutor(max_workers=min(8, len(versions))) as executor:
+            for future in [executor.submit(move_up, str(v)) for v in versions]:
+                future.result()
+
+    def get_context(self) -> SphinxContext:
+        """Gather the details about the project which are needed throughout
+        a build, like its theme, importing 'conf.py' if needed.
+        """
+        conf = self.load_conf_file()
+        assert hasattr(conf, "html_theme"), "'html_theme' must be defined in 'conf.py'"
+
+        theme = conf.html_theme
+        return SphinxContext(
+            conf_module=conf,
+            conf_path=self._conf_file,
+            theme=theme,
+            inject_location=self.get_theme_inject_location(theme),
+            theme_css_file=self.get_theme_css_file(theme),
+        )
+
     def get_conf_path(self) -> Path:
         """Get the filepath of 'conf.py'"""
         return self._conf_file
@@ -142,23 +244,15 @@ class Sphinx:
         """Go through the built HTML directory and get the names of
         all of the HTML files for this version.
         """
-        names: list[str] = []
-        for root, _, filenames in walk(version):
-            for filename in filenames:
-                path = Path(root) / filename
-                if path.suffix == ".html":
-                    names.append(str(path.relative_to(version)))
-
-        return names
+        return list(self.iter_html_file_names(version))
 
     @staticmethod
     def get_theme_css_file(theme: str) -> Path | None:
         """Get the path to the CSS file which should be included for
         this theme, if it is a supported theme.
         """
-        path = Path(__file__).parent / "static" / f"{theme}.css"
-        if path.exists():
-            return path
+        if theme in _AVAILABLE_THEMES:
+            return STATIC_DIR / f"{theme}.css"
 
         return None
 
@@ -169,21 +263,56 @@ class Sphinx:
         """
         return THEME_INJECT_POINT.get(theme)
 
+    def iter_html_file_names(self, version: Path) -> Iterator[str]:
+        """Lazily get the names of all of the HTML files for this version,
+        relative to the version's folder. See :meth:`get_html_file_names`.
+        """
+        return _iter_html(str(version))
+
     def load_conf_file(self) -> ModuleType:
         """Import the 'conf.py' file and get all of the variables
         defined within it.
         """
-        if not self._cached_conf:
-            initial_path = list(sys.path)
-            sys.path = [str(self._source_dir), *sys.path]
-
-            self._cached_conf = importlib.import_module("conf")
-            sys.path = initial_path
+        if self._cached_conf is None:
+            # loaded straight from its path rather than searching for it through
+            # sys.path. Like sphinx, it's run from its own folder, so the common
+            # sys.path.insert(0, os.path.abspath(".")) lets it import its siblings
+            spec = spec_from_file_location("conf", self._conf_file.resolve())
+            module = module_from_spec(spec)
+            initial_cwd = os.getcwd()
+            os.chdir(self._source_dir)
+            try:
+                spec.loader.exec_module(module)
+            finally:
+                os.chdir(initial_cwd)
+
+            self._cached_conf = module
 
         return self._cached_conf
 
     def write_root_html(self, build_path: Path, primary_version: str):
-        with open(build_path / "index.html", "w", encoding="utf-8") as file:
-            file.write(
-                REDIRECT_HTML.format(primary_version=f"{primary_version}/index.html")
+        # the file is tiny, so it's written in one go without a Python file object
+        fd = os.open(
+            build_path / "index.html", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644
+        )
+        try:
+            os.write(
+                fd,
+                _REDIRECT_PREFIX
+                + f"{primary_version}/index.html".encode("utf-8")
+                + _REDIRECT_SUFFIX,
             )
+        finally:
+            os.close(fd)
+
+
+def _iter_html(root: str, prefix: str = "") -> Iterator[str]:
+    """Recursively yield the paths of the HTML files under ``root``, relative
+    to it and prefixed with ``prefix``.
+    """
+    with scandir(root) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _iter_html(entry.path, f"{prefix}{entry.name}/")
+            elif entry.name.endswith(".html"):
+                yield prefix + entry.name
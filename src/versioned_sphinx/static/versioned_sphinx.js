@@ -34,7 +34,7 @@ let THEME_INJECT_POINT;
  * [{
  *      display_name: "0.0.1",
  *      primary: false,
- *      date: "2025-05-25 21:03:33-04:00",
+ *      date: "2025-05-25T21:03:33-04:00",
  *      name: "v0.0.1"
  * }]
  */
@@ -0,0 +1,85 @@
+"""Shared set up for the tests, like creating a small git repository with
+documentation, tags, and branches to run against.
+"""
+
+from pathlib import Path
+import os
+import subprocess
+
+
+GIT_ENV = {
+    **os.environ,
+    "GIT_AUTHOR_NAME": "test",
+    "GIT_AUTHOR_EMAIL": "test@example.com",
+    "GIT_COMMITTER_NAME": "test",
+    "GIT_COMMITTER_EMAIL": "test@example.com",
+    "GIT_CONFIG_NOSYSTEM": "1",
+    "HOME": os.devnull,
+}
+"""The environment git is run in, so that the tests don't depend on, or
+change, any of the user's git config
+"""
+
+CONF = """
+project = "test"
+html_theme = "alabaster"
+vs_control_css = "div.versioned-sphinx {}"
+"""
+
+
+def git(repo: Path, *args: str) -> str:
+    """Run a git command in ``repo``, returning its stdout"""
+    response = subprocess.run(
+        ["git", *args],
+        capture_output=True,
+        check=True,
+        cwd=repo,
+        env=GIT_ENV,
+        text=True,
+    )
+    return response.stdout.strip()
+
+
+def commit(repo: Path, message: str):
+    """Change the docs of ``repo`` and commit it"""
+    (repo / "docs" / "index.rst").write_text(
+        f"Test\n====\n\n{message}\n", encoding="utf-8"
+    )
+    git(repo, "add", "-A")
+    git(repo, "commit", "-q", "-m", message)
+
+
+def make_repo(root: Path, project: str = "") -> Path:
+    """Create a repository in ``root`` with sphinx docs, a remote named
+    ``origin``, and the versions:
+
+        * ``v1.0``, a lightweight tag
+        * ``v2.0``, an annotated tag
+        * ``v10.0``, a branch which is also pushed to ``origin``
+        * ``feature``, a local branch which doesn't look like a version
+
+    The docs are put in the ``project`` subfolder of the repository, like
+    a project in a monorepo, and that folder is returned.
+    """
+    root.mkdir(parents=True, exist_ok=True)
+    origin = root / "origin.git"
+    top = root / "repo"
+    git(root, "init", "-q", "--bare", str(origin))
+    git(root, "init", "-q", "-b", "main", str(top))
+
+    repo = top / project
+    (repo / "docs").mkdir(parents=True)
+    (repo / "docs" / "conf.py").write_text(CONF, encoding="utf-8")
+    (repo / ".gitignore").write_text("docs/build/\n", encoding="utf-8")
+    commit(repo, "one")
+    git(repo, "tag", "v1.0")
+
+    commit(repo, "two")
+    git(repo, "tag", "-a", "v2.0", "-m", "Version 2.0")
+
+    git(repo, "branch", "v10.0")
+    git(repo, "branch", "feature")
+    git(repo, "remote", "add", "origin", str(origin))
+    git(repo, "push", "-q", "origin", "main", "v10.0")
+    git(repo, "fetch", "-q", "origin")
+    return repo
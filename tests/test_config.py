@@ -0,0 +1,74 @@
+from pathlib import Path
+from types import ModuleType
+import unittest
+from versioned_sphinx.config import Config
+
+
+def make_conf(**attributes) -> ModuleType:
+    """Create a module like an imported 'conf.py' defining ``attributes``"""
+    conf = ModuleType("conf")
+    vars(conf).update(attributes)
+    return conf
+
+
+class ConfigParseTest(unittest.TestCase):
+    """Reading the configuration from 'conf.py' and the command line"""
+
+    def test_defaults(self):
+        self.assertEqual(Config.parse(make_conf(), {}), Config())
+
+    def test_current_version(self):
+        self.assertEqual(
+            Config.parse(make_conf(vs_current_version="v1.0"), {}).vs_current_version,
+            "v1.0",
+        )
+        self.assertEqual(
+            Config.parse(
+                make_conf(), {"vs_current_version": "v2.0"}
+            ).vs_current_version,
+            "v2.0",
+        )
+
+    def test_conf_takes_precedence(self):
+        config = Config.parse(
+            make_conf(vs_current_version="v1.0", vs_pattern="v*"),
+            {"vs_current_version": "v2.0", "vs_pattern": None, "vs_jobs": 2},
+        )
+        self.assertEqual(config.vs_current_version, "v1.0")
+        self.assertEqual(config.vs_pattern, "v*")
+        self.assertEqual(config.vs_jobs, 2)
+
+    def test_every_attribute(self):
+        attributes = {
+            "vs_build_path": Path("build"),
+            "vs_control_css": "div {}",
+            "vs_current_version": "v1.0",
+            "vs_display_name": str,
+            "vs_filter": bool,
+            "vs_git_ref_location": "local",
+            "vs_inject_selector": "div.body",
+            "vs_jobs": "auto",
+            "vs_pattern": "v*",
+            "vs_sort": sorted,
+        }
+        self.assertEqual(
+            Config.parse(make_conf(**attributes), {}), Config(**attributes)
+        )
+
+    def test_invalid_values(self):
+        for name, value, message in (
+            ("vs_current_version", 1, "must be a string"),
+            ("vs_display_name", "name", "must be callable"),
+            ("vs_git_ref_location", "everywhere", "must be in"),
+            ("vs_jobs", 0, "must be a positive integer or 'auto'"),
+            ("vs_build_path", 1, "must be a Path or string"),
+        ):
+            with self.subTest(name), self.assertRaisesRegex(AssertionError, message):
+                Config.parse(make_conf(**{name: value}), {})
+
+    def test_other_conf_attributes_are_ignored(self):
+        self.assertEqual(Config.parse(make_conf(project="test"), {}), Config())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+import unittest
+
+try:
+    from versioned_sphinx.ext import setup
+except ImportError:
+    setup = None
+
+
+class App:
+    """Records the files the extension adds, in place of a sphinx application"""
+
+    def __init__(self, outdir: Path):
+        self.outdir = outdir
+        self.css_files: list[str] = []
+        self.js_files: list[str] = []
+
+    def add_css_file(self, filename: str):
+        self.css_files.append(filename)
+
+    def add_js_file(self, filename: str):
+        self.js_files.append(filename)
+
+
+@unittest.skipIf(setup is None, "sphinx isn't installed")
+class SetupTest(unittest.TestCase):
+    def test_files_from_the_build_folder_are_added(self):
+        with TemporaryDirectory() as folder:
+            build = Path(folder)
+            outdir = build / "v1.0" / "html"
+            outdir.mkdir(parents=True)
+            for name in ("versioned_sphinx.css", "versioned_sphinx.js", "index.html"):
+                (build / name).write_text("", encoding="utf-8")
+            # only the build folder itself is looked in
+            (build / "v1.0" / "other.css").write_text("", encoding="utf-8")
+
+            app = App(outdir)
+            metadata = setup(app)
+
+        self.assertEqual(app.css_files, ["../../versioned_sphinx.css"])
+        self.assertEqual(app.js_files, ["../../versioned_sphinx.js"])
+        self.assertTrue(metadata["parallel_read_safe"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,192 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+import unittest
+from helpers import git, make_repo
+from versioned_sphinx.git import Git, GitTag
+
+
+class GitRefsTest(unittest.TestCase):
+    """Listing and matching the branches and tags of a repository"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls._temp = TemporaryDirectory()
+        cls.repo = make_repo(Path(cls._temp.name))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._temp.cleanup()
+
+    def setUp(self):
+        self.git = Git(self.repo)
+
+    def tearDown(self):
+        self.git.close()
+
+    def test_tags(self):
+        tags = {t.name: t for t in self.git.get_tags()}
+        self.assertEqual(tags.keys(), {"v1.0", "v2.0"})
+
+        # a lightweight tag is the commit, while an annotated tag has its own hash
+        self.assertEqual(tags["v1.0"].sha, git(self.repo, "rev-parse", "v1.0^{}"))
+        self.assertEqual(tags["v2.0"].sha, git(self.repo, "rev-parse", "v2.0"))
+        self.assertNotEqual(tags["v2.0"].sha, git(self.repo, "rev-parse", "v2.0^{}"))
+
+    def test_tags_only_list_tags(self):
+        self.git.get_tags()
+        self.assertEqual(list(self.git._refs_cache), [(None, ("refs/tags/",))])
+
+    def test_branch_locations(self):
+        local = self.git.get_branches(location="local")
+        remote = self.git.get_branches(location="remote")
+
+        self.assertEqual({b.name for b in local}, {"main", "v10.0", "feature"})
+        self.assertFalse(any(b.remote for b in local))
+        self.assertEqual({b.name for b in remote}, {"origin/main", "origin/v10.0"})
+        self.assertTrue(all(b.remote for b in remote))
+        self.assertEqual(
+            {b.name for b in self.git.get_branches(location="all")},
+            {b.name for b in local + remote},
+        )
+
+    def test_refs_are_split_by_kind(self):
+        branches, tags = self.git.get_refs(location="all")
+        self.assertTrue(all(isinstance(t, GitTag) for t in tags))
+        self.assertEqual({t.name for t in tags}, {"v1.0", "v2.0"})
+        self.assertNotIn("v1.0", {b.name for b in branches})
+
+    def test_refs_are_listed_with_one_command(self):
+        with patch.object(
+            self.git, "_list_refs", wraps=self.git._list_refs
+        ) as list_refs:
+            self.git.get_refs("v*", location="all")
+        list_refs.assert_called_once_with(
+            "v*", ("refs/tags/", "refs/heads/", "refs/remotes/")
+        )
+
+    def test_branches_and_tags_come_from_the_refs(self):
+        branches, tags = self.git.get_refs("v*", location="local")
+        self.assertEqual(self.git.get_branches("v*", location="local"), branches)
+        self.assertEqual(self.git.get_tags("v*"), tags)
+
+    def test_pattern_matches_the_whole_short_name(self):
+        # remote branches include the remote, so "v*" doesn't match them
+        branches, tags = self.git.get_refs("v*", location="all")
+        self.assertEqual([b.name for b in branches], ["v10.0"])
+        self.assertEqual({t.name for t in tags}, {"v1.0", "v2.0"})
+
+        branches, tags = self.git.get_refs("origin/v*", location="remote")
+        self.assertEqual([b.name for b in branches], ["origin/v10.0"])
+        self.assertEqual(tags, [])
+
+        self.assertEqual(self.git.get_tags("v1*"), [self.git.get_tags()[0]])
+
+    def test_batch_query(self):
+        batch = self.git._batch
+        self.assertEqual(
+            batch.query("refs/tags/v2.0"), (git(self.repo, "rev-parse", "v2.0"), "tag")
+        )
+        self.assertEqual(batch.query("refs/tags/v1.0")[1], "commit")
+        self.assertIsNone(batch.query("refs/tags/missing"))
+
+        # the process is started again if it's needed after closing
+        self.git.close()
+        self.assertIsNone(batch._process)
+        self.assertEqual(batch.query("HEAD")[1], "commit")
+
+    def test_cached_refs_are_copies(self):
+        self.git.get_tags().clear()
+        self.assertEqual(len(self.git.get_tags()), 2)
+
+
+class GitStateTest(unittest.TestCase):
+    """Checking and changing what the repository has checked out"""
+
+    def setUp(self):
+        self._temp = TemporaryDirectory()
+        self.repo = make_repo(Path(self._temp.name))
+        self.git = Git(self.repo)
+
+    def tearDown(self):
+        self.git.close()
+        self._temp.cleanup()
+
+    def test_not_a_repo(self):
+        with TemporaryDirectory() as folder:
+            with self.assertRaisesRegex(AssertionError, "not a git repository"):
+                Git(folder)
+
+    def test_current_branch_and_hash(self):
+        self.assertEqual(self.git.get_current_branch(), "main")
+        self.assertEqual(
+            self.git.get_current_hash(), git(self.repo, "rev-parse", "HEAD")
+        )
+
+    def test_prefix(self):
+        self.assertEqual(self.git.get_prefix(), "")
+
+        project = make_repo(Path(self._temp.name) / "mono", "packages/project")
+        subfolder = Git(project)
+        try:
+            self.assertEqual(subfolder.get_prefix(), "packages/project/")
+        finally:
+            subfolder.close()
+
+    def test_checkout(self):
+        self.git.checkout_branch("feature")
+        self.assertEqual(self.git.get_current_branch(), "feature")
+
+        self.git.checkout_tag("v1.0")
+        commit = git(self.repo, "rev-parse", "v1.0^{}")
+        self.assertEqual(self.git.get_current_hash(), commit)
+        # detached, so there's no branch to report
+        self.assertEqual(self.git.get_current_branch(), commit)
+
+    def test_caches_are_invalidated_on_checkout(self):
+        tags = self.git.get_tags()
+        git(self.repo, "tag", "v3.0")
+        self.assertEqual(self.git.get_tags(), tags)
+
+        self.git.checkout_branch("feature")
+        self.assertIn("v3.0", {t.name for t in self.git.get_tags()})
+
+    def test_checkout_with_pending_changes(self):
+        (self.repo / "docs" / "index.rst").write_text("changed", encoding="utf-8")
+        with self.assertRaisesRegex(AssertionError, "uncommitted changes"):
+            self.git.checkout_branch("feature")
+
+        # already checked out, so there's nothing which could be lost
+        self.git.checkout_branch("main")
+
+    def test_only_changes_to_tracked_files_are_pending(self):
+        index = self.repo / "docs" / "index.rst"
+        # rewriting a file with the same content, or adding a new one, is fine
+        index.write_text(index.read_text(encoding="utf-8"), encoding="utf-8")
+        (self.repo / "docs" / "new.rst").write_text("new", encoding="utf-8")
+        self.git.checkout_branch("feature")
+
+        index.write_text("changed", encoding="utf-8")
+        git(self.repo, "add", str(index))
+        with self.assertRaisesRegex(AssertionError, "uncommitted changes"):
+            self.git.checkout_branch("main")
+
+    def test_checkout_current_tag_with_pending_changes(self):
+        self.git.checkout_tag("v2.0")
+        (self.repo / "docs" / "index.rst").write_text("changed", encoding="utf-8")
+
+        # the annotated tag points at what's checked out, so nothing could be lost
+        self.git.checkout_tag("v2.0")
+        with self.assertRaisesRegex(AssertionError, "uncommitted changes"):
+            self.git.checkout_tag("v1.0")
+
+    def test_batch_restarts(self):
+        self.assertEqual(self.git._batch.query("HEAD")[1], "commit")
+        self.git._batch._process.kill()
+        self.git._batch._process.wait()
+        self.assertEqual(self.git._batch.query("HEAD")[1], "commit")
+        self.assertIsNone(self.git._batch.query("refs/heads/missing"))
+
+
+if __name__ == "__main__":
+    unittest.main()
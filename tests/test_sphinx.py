@@ -0,0 +1,129 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+import os
+import sys
+import unittest
+from versioned_sphinx.sphinx import Sphinx
+
+
+class ConsolidateTest(unittest.TestCase):
+    def test_html_is_moved_up(self):
+        with TemporaryDirectory() as folder:
+            versions = [Path(folder) / "v1.0", Path(folder) / "v2.0"]
+            for v in versions:
+                (v / "doctrees").mkdir(parents=True)
+                (v / "html" / "_static").mkdir(parents=True)
+                (v / "html" / "index.html").write_text(v.name, encoding="utf-8")
+                (v / "html" / "_static" / "style.css").write_text("", encoding="utf-8")
+
+            Sphinx.consolidate_html_versions(versions)
+
+            for v in versions:
+                self.assertEqual(
+                    sorted(p.name for p in v.iterdir()), ["_static", "index.html"]
+                )
+                self.assertEqual((v / "index.html").read_text(), v.name)
+                self.assertTrue((v / "_static" / "style.css").is_file())
+
+    def test_no_versions(self):
+        Sphinx.consolidate_html_versions([])
+
+
+class HTMLFileNamesTest(unittest.TestCase):
+    def test_names_are_relative_to_the_version(self):
+        with TemporaryDirectory() as folder:
+            repo = Path(folder).resolve()
+            (repo / "docs").mkdir()
+            (repo / "docs" / "conf.py").write_text("", encoding="utf-8")
+            sphinx = Sphinx(repo)
+            Sphinx._CONF_CACHE.pop(repo)
+
+            version = repo / "docs" / "build" / "v1.0"
+            (version / "guide" / "advanced").mkdir(parents=True)
+            for name in (
+                "index.html",
+                "objects.inv",
+                "guide/index.html",
+                "guide/advanced/tips.html",
+            ):
+                (version / name).write_text("", encoding="utf-8")
+
+            self.assertEqual(
+                sorted(sphinx.get_html_file_names(version)),
+                ["guide/advanced/tips.html", "guide/index.html", "index.html"],
+            )
+
+
+class ConfSearchTest(unittest.TestCase):
+    """Finding 'conf.py', and only searching for it once per repo"""
+
+    def setUp(self):
+        self._temp = TemporaryDirectory()
+        self.repo = Path(self._temp.name).resolve()
+        self.conf = self.repo / "docs" / "source" / "conf.py"
+        self.conf.parent.mkdir(parents=True)
+        self.conf.write_text("", encoding="utf-8")
+
+    def tearDown(self):
+        Sphinx._CONF_CACHE.pop(self.repo, None)
+        self._temp.cleanup()
+
+    def test_nested_conf(self):
+        self.assertEqual(Sphinx(self.repo).get_conf_path(), self.conf)
+
+    def test_search_is_cached(self):
+        Sphinx(self.repo)
+        moved = self.repo / "docs" / "moved" / "conf.py"
+        moved.parent.mkdir()
+        self.conf.rename(moved)
+
+        # however the repo is referred to
+        self.assertEqual(Sphinx(self.repo / "docs" / "..").get_conf_path(), self.conf)
+
+        # giving the path explicitly replaces what was found
+        self.assertEqual(Sphinx(self.repo, moved).get_conf_path(), moved)
+        self.assertEqual(Sphinx(self.repo).get_conf_path(), moved)
+
+    def test_missing_conf(self):
+        self.conf.unlink()
+        with self.assertRaisesRegex(AssertionError, "Could not find 'conf.py'"):
+            Sphinx(self.repo)
+
+
+class LoadConfTest(unittest.TestCase):
+    def setUp(self):
+        self._temp = TemporaryDirectory()
+        self.repo = Path(self._temp.name).resolve()
+        self.docs = self.repo / "docs"
+        self.docs.mkdir()
+        (self.docs / "vs_test_settings.py").write_text(
+            'THEME = "alabaster"\n', encoding="utf-8"
+        )
+        (self.docs / "conf.py").write_text(
+            "import os, sys\n"
+            + 'sys.path.insert(0, os.path.abspath("."))\n'
+            + "from vs_test_settings import THEME\n"
+            + "html_theme = THEME\n",
+            encoding="utf-8",
+        )
+
+    def tearDown(self):
+        Sphinx._CONF_CACHE.pop(self.repo, None)
+        sys.modules.pop("vs_test_settings", None)
+        if str(self.docs) in sys.path:
+            sys.path.remove(str(self.docs))
+        self._temp.cleanup()
+
+    def test_conf_imports_its_siblings(self):
+        cwd = os.getcwd()
+        sphinx = Sphinx(self.repo)
+
+        conf = sphinx.load_conf_file()
+        self.assertEqual(conf.html_theme, "alabaster")
+        self.assertEqual(os.getcwd(), cwd)
+        self.assertIs(sphinx.load_conf_file(), conf)
+        self.assertEqual(sphinx.get_context().theme, "alabaster")
+
+
+if __name__ == "__main__":
+    unittest.main()
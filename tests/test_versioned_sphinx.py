@@ -0,0 +1,290 @@
+from dataclasses import dataclass, replace
+from datetime import datetime
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from types import ModuleType
+import json
+import shutil
+import unittest
+from helpers import git, make_repo
+from versioned_sphinx import (
+    MANIFEST_FILE,
+    execute,
+    load_manifest,
+    natural_sort_tuple,
+    remove_in_background,
+    remove_leftovers,
+    sort_branches_and_tags,
+    write_control_css,
+)
+from versioned_sphinx.config import Config
+from versioned_sphinx.git import Git, GitBranch, GitTag
+from versioned_sphinx.sphinx import Sphinx, SphinxContext
+
+
+class NaturalSortTest(unittest.TestCase):
+    def test_numbers_are_split_out(self):
+        self.assertEqual(natural_sort_tuple("v1.10"), ["v", 1, ".", 10, ""])
+        self.assertEqual(natural_sort_tuple("10"), ["", 10, ""])
+        self.assertEqual(natural_sort_tuple("main"), ["main"])
+
+    def test_only_numbers_are_converted(self):
+        parts = natural_sort_tuple("v01.2rc3")
+        self.assertEqual(parts, ["v", 1, ".", 2, "rc", 3, ""])
+        self.assertEqual([type(p) for p in parts[1::2]], [int, int, int])
+        self.assertEqual({type(p) for p in parts[::2]}, {str})
+
+    def test_sort(self):
+        names = ["v1.0", "v10.0", "v2.0", "v1.2", "v1.10"]
+        self.assertEqual(
+            sorted(names, key=natural_sort_tuple),
+            ["v1.0", "v1.2", "v1.10", "v2.0", "v10.0"],
+        )
+
+    def test_sort_branches_and_tags(self):
+        date = datetime(2024, 1, 1)
+        bts = [
+            GitTag(date, "v2.0"),
+            GitBranch(date, "v10.0", False),
+            GitTag(date, "v1.0"),
+        ]
+
+        self.assertEqual(
+            [bt.name for bt in sort_branches_and_tags(Config(), bts)],
+            ["v10.0", "v2.0", "v1.0"],
+        )
+
+        # the display names are sorted on, if there are any
+        config = Config(vs_display_name=lambda bt: bt.name.replace("v10", "v0"))
+        self.assertEqual(
+            [bt.name for bt in sort_branches_and_tags(config, bts)],
+            ["v2.0", "v1.0", "v10.0"],
+        )
+
+
+class ControlCSSTest(unittest.TestCase):
+    def setUp(self):
+        self._temp = TemporaryDirectory()
+        self.folder = Path(self._temp.name)
+        (self.folder / "theme.css").write_text("theme", encoding="utf-8")
+        (self.folder / "control.css").write_text("control", encoding="utf-8")
+        self.context = SphinxContext(
+            conf_module=ModuleType("conf"),
+            conf_path=self.folder / "conf.py",
+            theme="test",
+            inject_location=None,
+            theme_css_file=self.folder / "theme.css",
+        )
+
+    def tearDown(self):
+        self._temp.cleanup()
+
+    def write(self, control_css: Path | str | None) -> str:
+        write_control_css(Config(vs_control_css=control_css), self.context, self.folder)
+        return (self.folder / "versioned_sphinx.css").read_text(encoding="utf-8")
+
+    def test_css(self):
+        # mentioning a CSS file doesn't make it a path
+        css = "/* like theme.css */ div.versioned-sphinx {}"
+        self.assertEqual(self.write(css), css)
+
+    def test_paths(self):
+        # relative to conf.py
+        self.assertEqual(self.write("control.css"), "control")
+        self.assertEqual(self.write(str(self.folder / "control.css")), "control")
+        self.assertEqual(self.write(Path("control.css")), "control")
+
+    def test_theme_css(self):
+        self.assertEqual(self.write(None), "theme")
+
+
+class RemovalTest(unittest.TestCase):
+    def test_remove_in_background(self):
+        with TemporaryDirectory() as folder:
+            build = Path(folder) / "build"
+            (build / "v1.0").mkdir(parents=True)
+
+            removal = remove_in_background(build / "v1.0")
+            self.assertFalse((build / "v1.0").exists())
+            removal.join()
+            self.assertEqual(list(build.iterdir()), [])
+
+    def test_leftovers_are_removed(self):
+        with TemporaryDirectory() as folder:
+            build = Path(folder) / "build"
+            (build / "v1.0.old.0123abcd").mkdir(parents=True)
+            (build / "v1.0.old.notmine").mkdir()
+            (Path(folder) / "build.old.89abcdef").mkdir()
+            (Path(folder) / "other.old.89abcdef").mkdir()
+
+            for removal in remove_leftovers(build):
+                removal.join()
+            self.assertEqual(
+                sorted(p.name for p in Path(folder).iterdir()),
+                ["build", "other.old.89abcdef"],
+            )
+            self.assertEqual([p.name for p in build.iterdir()], ["v1.0.old.notmine"])
+
+    def test_display_names_are_computed_once(self):
+        date = datetime(2024, 1, 1)
+        bts = [GitTag(date, "v2.0"), GitTag(date, "v1.0"), GitTag(date, "v10.0")]
+        calls = []
+
+        def display_name(bt: GitTag) -> str:
+            calls.append(bt.name)
+            return bt.name
+
+        config = Config(vs_display_name=display_name)
+        sort_branches_and_tags(config, bts)
+        self.assertEqual(sorted(calls), ["v1.0", "v10.0", "v2.0"])
+
+        # and not at all when they're already known
+        calls.clear()
+        sort_branches_and_tags(config, bts, {id(bt): bt.name for bt in bts})
+        self.assertEqual(calls, [])
+
+
+@unittest.skipIf(shutil.which("sphinx-build") is None, "sphinx isn't installed")
+class ExecuteTest(unittest.TestCase):
+    """Building every version, and only rebuilding what has changed"""
+
+    def setUp(self):
+        self._temp = TemporaryDirectory()
+        self.repo = make_repo(Path(self._temp.name))
+        self.build = self.repo / "docs" / "build"
+        self.sphinx = Sphinx(self.repo)
+
+    def tearDown(self):
+        self._temp.cleanup()
+
+    def execute(self, **attributes) -> dict[str, dict[str, str]]:
+        config = Config(
+            vs_build_path=self.build,
+            vs_control_css="div.versioned-sphinx {}",
+            vs_git_ref_location="local",
+            vs_jobs=1,
+            vs_pattern="v*",
+            **attributes,
+        )
+        # a new Git each time, like each run of the command line tool, since
+        # it caches refs which the tests change between runs
+        git_repo = Git(self.repo)
+        try:
+            execute(config, git_repo, self.sphinx)
+        finally:
+            git_repo.close()
+        return load_manifest(self.build)
+
+    def test_build(self):
+        manifest = self.execute()
+
+        self.assertEqual(manifest.keys(), {"v1.0", "v2.0", "v10.0"})
+        for name, details in manifest.items():
+            self.assertEqual(details["sha"], git(self.repo, "rev-parse", name))
+            self.assertTrue((self.build / name / "index.html").is_file())
+            self.assertFalse((self.build / name / "html").exists())
+
+        self.assertIn("v10.0/index.html", (self.build / "index.html").read_text())
+
+    def test_current_version(self):
+        self.execute(vs_current_version="v1.0")
+        self.assertIn("v1.0/index.html", (self.build / "index.html").read_text())
+
+    def test_unchanged_versions_are_skipped(self):
+        first = self.execute()
+        with self.assertLogs("versioned-sphinx", "INFO") as logs:
+            second = self.execute()
+
+        self.assertEqual(first, second)
+        self.assertEqual(
+            sum("unchanged since the last build" in line for line in logs.output), 3
+        )
+
+    def test_changed_and_removed_versions(self):
+        first = self.execute()
+
+        git(self.repo, "tag", "-d", "v1.0")
+        git(self.repo, "checkout", "-q", "v10.0")
+        (self.repo / "docs" / "index.rst").write_text("Changed\n=======\n")
+        git(self.repo, "commit", "-q", "-am", "change")
+        git(self.repo, "checkout", "-q", "main")
+        second = self.execute()
+
+        self.assertEqual(second.keys(), {"v2.0", "v10.0"})
+        self.assertFalse((self.build / "v1.0").exists())
+        self.assertEqual(second["v2.0"], first["v2.0"])
+        self.assertNotEqual(second["v10.0"]["sha"], first["v10.0"]["sha"])
+        self.assertIn("Changed", (self.build / "v10.0" / "index.html").read_text())
+
+    def test_failed_rebuild_is_not_skipped(self):
+        self.execute()
+        shutil.rmtree(self.build / "v2.0")
+
+        # the hash still matches, but the rebuild fails before consolidating
+        def fail(output: Path, *_):
+            (output / "html").mkdir(parents=True)
+            raise RuntimeError("build failed")
+
+        self.sphinx.build = fail
+        with self.assertRaises(RuntimeError):
+            self.execute()
+        self.assertNotIn("v2.0", load_manifest(self.build))
+
+        del self.sphinx.build
+        self.assertIn("v2.0", self.execute())
+        self.assertTrue((self.build / "v2.0" / "index.html").is_file())
+        self.assertFalse((self.build / "v2.0" / "html").exists())
+
+    def test_unmanaged_build_folder_is_replaced(self):
+        self.build.mkdir()
+        (self.build / "stale.html").write_text("")
+
+        self.execute()
+        self.assertFalse((self.build / "stale.html").exists())
+        self.assertTrue((self.build / MANIFEST_FILE).is_file())
+
+    def test_project_in_a_subfolder(self):
+        # worktrees contain the whole repository, not just the project's folder
+        self.repo = make_repo(Path(self._temp.name) / "mono", "packages/project")
+        self.build = self.repo / "docs" / "build"
+        self.sphinx = Sphinx(self.repo)
+
+        manifest = self.execute()
+        self.assertEqual(manifest.keys(), {"v1.0", "v2.0", "v10.0"})
+        self.assertIn("two", (self.build / "v2.0" / "index.html").read_text())
+
+    def test_sort_may_return_other_dataclasses(self):
+        @dataclass
+        class Release(GitTag):
+            notes: str = ""
+
+        self.execute(
+            vs_sort=lambda bts: [
+                Release(bt.date, bt.name, bt.sha, notes=f"notes for {bt.name}")
+                for bt in bts
+            ],
+        )
+
+        versions = (self.build / "versioned_sphinx.js").read_text()
+        versions = versions.split("VERSIONS = ", 1)[1].rstrip().rstrip(";")
+        self.assertEqual(
+            {v["notes"] for v in json.loads(versions)},
+            {"notes for v1.0", "notes for v2.0", "notes for v10.0"},
+        )
+
+    def test_sort_may_return_new_objects(self):
+        self.execute(
+            vs_display_name=lambda bt: bt.name.upper(),
+            vs_sort=lambda bts: [replace(bt) for bt in bts],
+        )
+
+        versions = (self.build / "versioned_sphinx.js").read_text()
+        versions = versions.split("VERSIONS = ", 1)[1].rstrip().rstrip(";")
+        self.assertEqual(
+            {v["display_name"] for v in json.loads(versions)},
+            {"V1.0", "V2.0", "V10.0"},
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()